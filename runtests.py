@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+Run the test suite. Uses an in-memory SQLite database, unless
+SOUPMIGRATION_TEST_DB=postgresql is set, in which case the PostgreSQL
+database is configured with the PGDATABASE, PGUSER, PGPASSWORD, PGHOST and
+PGPORT environment variables.
+"""
+import os
+import sys
+import django
+from django.conf import settings
+
+if os.environ.get('SOUPMIGRATION_TEST_DB') == 'postgresql':
+    database = {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': os.environ.get('PGDATABASE', 'soupmigration'),
+        'USER': os.environ.get('PGUSER', ''),
+        'PASSWORD': os.environ.get('PGPASSWORD', ''),
+        'HOST': os.environ.get('PGHOST', ''),
+        'PORT': os.environ.get('PGPORT', ''),
+    }
+else:
+    database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+
+settings.configure(
+    DATABASES={'default': database},
+    INSTALLED_APPS=['tests'],
+    MIDDLEWARE_CLASSES=(),
+)
+
+if hasattr(django, 'setup'):
+    django.setup()
+
+from django.test.utils import get_runner
+
+if __name__ == '__main__':
+    TestRunner = get_runner(settings)
+    failures = TestRunner().run_tests(sys.argv[1:] or ['tests'])
+    sys.exit(bool(failures))
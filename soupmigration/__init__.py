@@ -4,6 +4,7 @@ Useful when you need to migrate data from a crappy MySQL database to your
 Django models. Requires MySQLdb and Django (obviously).
 """
 from soupmigration.base import Data, Migration, Log
+from soupmigration.runner import MigrationRunner
 
 __version__ = "0.1.0"
 __authors__ = ["Jacob Magnusson <m@jacobian.se>"]
@@ -1,15 +1,29 @@
 import re
 import json
+import heapq
+import cPickle
+import tempfile
+import itertools
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from django.db import connection, IntegrityError
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction, IntegrityError, DatabaseError
 from django.db.models import Model
-from soupmigration.utils import regex_lookups, remove_lookup_type
-from django.db import settings
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.deletion import CASCADE, SET_NULL, SET_DEFAULT
+from django.db.models.deletion import PROTECT, DO_NOTHING, ProtectedError
+from soupmigration.utils import regex_lookups, remove_lookup_type, is_empty
+from soupmigration.utils import to_text, to_list
+from django.conf import settings
 import MySQLdb
+import MySQLdb.cursors
 
 __all__ = ['Data', 'Migration', 'Log']
 
 
+class UnsupportedOnDelete(Exception):
+    """ Raised when a relation's `on_delete` can't be done in SQL. """
+
+
 class Data(object):
     """ Load tables and their data from a MySQL database.
 
@@ -61,9 +75,42 @@ class Data(object):
             },
             ...
         ]
+
+    `external_merge`, if True tables are streamed from the database and
+     written to temporary files as runs of `merge_run_size` rows sorted on
+     `unique_field`. `merge` then does a streaming k-way merge of the runs
+     instead of holding every table in memory, and `merged_data` becomes an
+     iterator that yields the merged rows already sorted on `unique_field`.
+     Useful when the tables don't fit in memory. Requires `mapping`. As the
+     `Migration` methods need `data` to be a list, insert the rows with
+     `Migration.insert_batches(data.merged_data)` rather than assigning them
+     to `Migration.data`.
+
+    `typed`, if True values keep their native Python types instead of being
+     converted to unicode strings by `clean`. One converter per column is
+     built from the column types returned by `DESCRIBE`. If `model` is also
+     set, values of columns that map to one of its (non-relational) fields
+     are converted to that field's type. Strings are stripped, and
+     `empty_values` only apply to columns whose target takes strings, so a
+     numeric 0 is kept. Empty values become None, or u'' for targets that
+     allow empty strings.
+
+    `sample_modulo` and `sample_limit` load a deterministic sample of the
+     tables, e.g. for a quick dry run of a migration. Both are applied in the
+     SQL query on the (original) `unique_field` column, the same way for all
+     tables, so rows that belong together are sampled together:
+        sample_modulo = 100 # Rows where CRC32(unique_field) % 100 = 0
+        sample_limit = 1000 # Rows with a unique_field up to the 1000th
+                            # lowest of the first table in `table_order`
+     Can also be passed as keyword arguments.
     """
     empty_values = []
     unique_field = ('id', '__UNIQUE_FIELD__')
+    typed = False
+    external_merge = False
+    merge_run_size = 100000
+    sample_modulo = None
+    sample_limit = None
 
     def __init__(self, **kwargs):
         self.connect_kwargs = {
@@ -82,15 +129,25 @@ class Data(object):
         self.cursor = self.connection.cursor()
         self.tables = []
         self.data = {}
+        self.runs = {}
+        self.converters = {}
+        self.empty_defaults = {}
         self.merged_data = []
         self.log = Log()
         self.empty_values += [None, 'None', 'NULL', '0']
+        self.sample_modulo = kwargs.pop('sample_modulo', self.sample_modulo)
+        self.sample_limit = kwargs.pop('sample_limit', self.sample_limit)
+        self.sample_cutoff = None
 
 
         # Warn on invalid keyword arguments.
         for kwarg in kwargs:
             print u'"{}" is not a valid keyword argument.'.format(kwarg)
 
+        if self.external_merge:
+            assert hasattr(self, 'mapping'), 'You need to supply `mapping` ' \
+                'to use `external_merge`.'
+
         if hasattr(self, 'mapping'):
             if 'all' in self.mapping:
                 self.mapping['all'].update([self.unique_field])
@@ -118,71 +175,274 @@ class Data(object):
         if not self.tables:
             self.load_table_names()
 
+        if self.sample_limit:
+            self.sample_cutoff = self.get_sample_cutoff()
+
         for table in self.tables:
             self.data[table] = []
 
             # Get column names
             self.cursor.execute('DESCRIBE `{}`'.format(table))
-            keys = [column[0] for column in self.cursor.fetchall()]
+            columns = self.cursor.fetchall()
+            keys = [column[0] for column in columns]
+            if self.typed:
+                self.build_converters(table, columns)
+
+            if self.external_merge:
+                self.spill_table(table, keys)
+                print u'Loaded table `{}` into {} run(s).'.format(
+                    table, len(self.runs[table]))
+                continue
 
             # Get data
-            self.cursor.execute('SELECT * FROM `{}`'.format(table))
+            self.cursor.execute(*self.get_select_sql(table))
             all_data = [data for data in self.cursor.fetchall()]
 
             # Append data
             for row in all_data:
                 assert len(keys) is len(row)
-                dic = dict(zip(keys, row))
-
-                # If we have a mapping, rename and delete keys as specified.
-                if hasattr(self, 'mapping'):
-                    for_all = self.mapping.pop('all', {})
-                    for mapping_keys in self.mapping:
-                        self.mapping[mapping_keys].update(for_all)
-                    items_to_add = {}
-                    keys_to_del = []
-
-                    old_unique, new_unique = self.unique_field
-
-                    # Rename unique key if new name was specified
-                    if new_unique and old_unique != new_unique:
-                        dic[new_unique] = dic[old_unique]
-                        del dic[old_unique]
-
-                    for key in dic:
-                        if key == new_unique:
-                            continue
-                        new_key = self.mapping[table].get(key)
-                        if new_key:
-                            items_to_add[new_key] = dic[key]
-                            keys_to_del.append(key)
-                        if key not in self.mapping[table]:
-                            dic[key] = ''
-
-                    keys_to_del.reverse()
-                    for k in keys_to_del:
-                        del dic[k]
-                    for i in items_to_add:
-                        dic[i] = items_to_add[i]
-
-                self.data[table].append(dic)
+                dic = self.convert_row(table, dict(zip(keys, row)))
+                self.data[table].append(self.map_row(table, dic))
 
             print u'Loaded table `{}`.'.format(table)
 
+    def fold_all_mapping(self):
+        """ Add the columns of the 'all' mapping to every table's mapping. """
+        for_all = self.mapping.pop('all', {})
+        for mapping_keys in self.mapping:
+            self.mapping[mapping_keys].update(for_all)
+
+    def get_sample_where(self):
+        """ Return the WHERE clause and its params used to sample all tables.
+        """
+        unique = self.unique_field[0]
+        where, params = [], []
+        if self.sample_modulo:
+            where.append('CRC32(`{}`) %% {:d} = 0'.format(
+                unique, self.sample_modulo))
+        if self.sample_cutoff is not None:
+            where.append('`{}` <= %s'.format(unique))
+            params.append(self.sample_cutoff)
+        if not where:
+            return '', params
+        return ' WHERE ' + ' AND '.join(where), params
+
+    def get_sample_cutoff(self):
+        """ Return the highest `unique_field` value among the `sample_limit`
+        lowest of the first table in `table_order` (or `tables`) that has any
+        rows. Every table is then limited to values up to it, so the sampled
+        tables cover the same keys.
+        """
+        unique = self.unique_field[0]
+        where, params = self.get_sample_where()
+        tables = getattr(self, 'table_order', self.tables)
+        for table in [t for t in tables if t in self.tables]:
+            self.cursor.execute(
+                'SELECT MAX(`{0}`) FROM (SELECT `{0}` FROM `{1}`{2} '
+                'ORDER BY `{0}` LIMIT {3:d}) AS sample'.format(
+                    unique, table, where, self.sample_limit), params)
+            cutoff = self.cursor.fetchone()[0]
+            if cutoff is not None:
+                return cutoff
+        return None
+
+    def get_select_sql(self, table):
+        """ Return the query and params that load `table`, sampled if
+        requested.
+        """
+        where, params = self.get_sample_where()
+        return 'SELECT * FROM `{}`{}'.format(table, where), params
+
+    def map_row(self, table, dic):
+        """ Rename and delete keys of a row as specified by `mapping`. """
+        if not hasattr(self, 'mapping'):
+            return dic
+
+        self.fold_all_mapping()
+        items_to_add = {}
+        keys_to_del = []
+
+        old_unique, new_unique = self.unique_field
+
+        # Rename unique key if new name was specified
+        if new_unique and old_unique != new_unique:
+            dic[new_unique] = dic[old_unique]
+            del dic[old_unique]
+
+        for key in dic:
+            if key == new_unique:
+                continue
+            new_key = self.mapping[table].get(key)
+            if new_key:
+                items_to_add[new_key] = dic[key]
+                keys_to_del.append(key)
+            if key not in self.mapping[table]:
+                dic[key] = ''
+
+        keys_to_del.reverse()
+        for k in keys_to_del:
+            del dic[k]
+        for i in items_to_add:
+            dic[i] = items_to_add[i]
+        return dic
+
+    def spill_table(self, table, keys):
+        """ Stream `table` from the database into sorted runs on disk.
+        Rows are mapped and cleaned as they arrive, `merge_run_size` rows at a
+        time, so only one run is held in memory.
+        """
+        self.runs[table] = []
+        cursor = self.connection.cursor(MySQLdb.cursors.SSCursor)
+        try:
+            cursor.execute(*self.get_select_sql(table))
+            while True:
+                rows = cursor.fetchmany(self.merge_run_size)
+                if not rows:
+                    break
+                run = []
+                for row in rows:
+                    assert len(keys) is len(row)
+                    dic = self.convert_row(table, dict(zip(keys, row)))
+                    dic = self.map_row(table, dic)
+                    if not self.typed:
+                        self.clean_row(dic)
+                    run.append(dic)
+                self.runs[table].append(self.write_run(run))
+        finally:
+            cursor.close()
+
+    def write_run(self, rows):
+        """ Sort `rows` on `unique_field` and write them to a temp file. """
+        unique_field = self.unique_field[1]
+        rows.sort(key=lambda dic: dic[unique_field])
+        run = tempfile.TemporaryFile()
+        for dic in rows:
+            cPickle.dump(dic, run, cPickle.HIGHEST_PROTOCOL)
+        return run
+
+    def read_run(self, run, *prefix):
+        """ Yield the rows of a run as `(unique_value,) + prefix + (i, row)`
+        tuples, which keeps them in a stable order when merged with other runs.
+        """
+        unique_field = self.unique_field[1]
+        run.seek(0)
+        for i in itertools.count():
+            try:
+                dic = cPickle.load(run)
+            except EOFError:
+                return
+            yield (dic[unique_field],) + prefix + (i, dic)
+
+    def close_runs(self):
+        """ Close (and thereby delete) all temporary run files. """
+        for runs in self.runs.values():
+            for run in runs:
+                run.close()
+        self.runs = {}
+
+    def mapped_name(self, table, column):
+        """ Return the name `column` of `table` will have after mapping. """
+        if not hasattr(self, 'mapping'):
+            return column
+        self.fold_all_mapping()
+        return self.mapping[table].get(column) or column
+
+    def get_model_field(self, name):
+        """ Return the non-relational field `name` of `model`, if any. """
+        if not hasattr(self, 'model'):
+            return None
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.rel:
+            return None # Related objects are looked up by `Migration`
+        return field
+
+    def build_converters(self, table, columns):
+        """ Build one converter per column of `table`.
+        `columns` is the result of `DESCRIBE`, i.e. a list of tuples beginning
+        with the column name and type.
+        """
+        self.converters[table] = {}
+        for column in columns:
+            name, column_type = column[0], column[1]
+            field = self.get_model_field(self.mapped_name(table, name))
+            converter, empty = self.get_converter(table, name, column_type,
+                                                  field)
+            self.converters[table][name] = converter
+            self.empty_defaults[self.mapped_name(table, name)] = empty
+
+    def get_converter(self, table, name, column_type, field=None):
+        """ Return a 2-tuple (converter, empty value) for a column.
+        Text columns without a model field, and fields that allow empty
+        strings, use u'' as their empty value. Everything else uses None.
+        The `unique_field` column is converted to unicode unless it maps to a
+        model field, so that it has the same type in every table.
+        """
+        base_type = re.split(r'[\s(]', column_type.lower())[0]
+        if field is not None:
+            text = field.empty_strings_allowed
+            to_python = field.to_python
+        elif name == self.unique_field[0]:
+            # `merge` compares the keys of all tables with each other.
+            text, to_python = True, to_text
+        else:
+            text = base_type in ('char', 'varchar', 'tinytext', 'text',
+                                 'mediumtext', 'longtext', 'enum', 'set')
+            to_python = None
+        empty = u'' if text else None
+        empty_values = self.empty_values if text else [None, u'']
+        log = self.log
+
+        def convert(value):
+            if isinstance(value, basestring):
+                value = value.strip()
+            if value in empty_values:
+                return empty
+            if to_python is None:
+                return value
+            try:
+                return to_python(value)
+            except (ValidationError, ValueError, TypeError) as e:
+                log.add(affected=value, exception=e,
+                    msg=u'Could not convert values of `{}`.`{}` to {}.'.format(
+                        table, name, field.__class__.__name__),
+                )
+                return empty
+        return convert, empty
+
+    def convert_row(self, table, dic):
+        """ Convert a row in place using the converters of `table`. """
+        if not self.typed:
+            return dic
+        converters = self.converters[table]
+        for key, value in dic.items():
+            dic[key] = converters[key](value)
+        return dic
+
     def clean(self):
         """ Clean data.
         Convert all data to unicode strings and strip trailing / leading
         whitespace and clear values that are deemed empty by `empty_values`.
+        Does nothing if `typed` is True, as values are then converted by
+        `convert_row` while loading.
         """
+        if self.typed:
+            return
         for table in self.data:
             for dic in self.data[table]:
-                for key, value in dic.items():
-                    if not isinstance(value, basestring):
-                        value = unicode(value)
-                    dic[key] = value.strip()
-                    if hasattr(self, 'empty_values'):
-                        if value in self.empty_values:
-                            dic[key] = u''
+                self.clean_row(dic)
+
+    def clean_row(self, dic):
+        """ Clean a single row in place. See `clean`. """
+        for key, value in dic.items():
+            if not isinstance(value, basestring):
+                value = unicode(value)
+            dic[key] = value.strip()
+            if hasattr(self, 'empty_values'):
+                if value in self.empty_values:
+                    dic[key] = u''
 
     def _get_mapping_keys(self):
         assert getattr(self, 'mapping')
@@ -192,6 +452,13 @@ class Data(object):
                 mapping_keys.add(value or key)
         return mapping_keys
 
+    def _get_default_dic(self):
+        default_dic = dict.fromkeys(self._get_mapping_keys(), '')
+        if self.typed:
+            for key in default_dic:
+                default_dic[key] = self.empty_defaults.get(key)
+        return default_dic
+
     def _get_default_mapping(self, *args):
         assert self.data
         mapping = {}
@@ -210,6 +477,10 @@ class Data(object):
         assert self.mapping, \
             'You need to supply `mapping` for this function.'
 
+        if self.external_merge:
+            self.merged_data = self.iter_merged()
+            return
+
         old_unique_field, unique_field = self.unique_field
 
         # Set unique_field and default values to avoid KeyError exceptions
@@ -217,7 +488,7 @@ class Data(object):
         # added.
         self.merged_data = []
         unique_items = set()
-        default_dic = dict.fromkeys(self._get_mapping_keys(), '')
+        default_dic = self._get_default_dic()
         for table in self.data:
             for dic in self.data[table]:
                 unique_items.add(dic[unique_field])
@@ -236,18 +507,58 @@ class Data(object):
                 for m_dic in self.merged_data:
                     if dic[unique_field] == m_dic[unique_field]:
                         # Only update when value is not empty
-                        update_dic = [d for d in dic.items() if d[1].strip()]
+                        update_dic = [d for d in dic.items()
+                                      if not is_empty(d[1])]
                         m_dic.update(update_dic)
                         break
         self.merged_data = sorted(self.merged_data,
                                   key=lambda dic: dic[unique_field])
 
+    def iter_merged(self):
+        """ Merge the sorted runs written by `spill_table` and yield the
+        merged rows in `unique_field` order. Same rules as `merge`: rows of
+        tables earlier in `table_order` replace non-empty values of later ones.
+        The run files are deleted once the iterator is exhausted.
+        """
+        old_unique_field, unique_field = self.unique_field
+        default_dic = self._get_default_dic()
+
+        # Tables are applied in reverse table order, so a lower rank means
+        # less important.
+        table_order = list(reversed(
+            getattr(self, 'table_order', self.mapping.keys())))
+        streams = []
+        for t, table in enumerate(self.tables):
+            rank = table_order.index(table) if table in table_order else None
+            for r, run in enumerate(self.runs.get(table, [])):
+                streams.append(self.read_run(run, rank, t, r))
+
+        try:
+            merged = heapq.merge(*streams)
+            for value, rows in itertools.groupby(merged, key=lambda r: r[0]):
+                if not value:
+                    continue
+                m_dic = dict(default_dic)
+                m_dic[unique_field] = value
+                for row in rows:
+                    rank, dic = row[1], row[-1]
+                    if rank is None:
+                        continue
+                    # Only update when value is not empty
+                    m_dic.update([d for d in dic.items()
+                                  if not is_empty(d[1])])
+                yield m_dic
+        finally:
+            self.close_runs()
+
 
 class Migration(object):
     """ The base migration class where data is processed and inserted.
 
     Explanation of the most important class attributes:
-        `model`, the model that data is insert into.
+        `model`, the model that data is insert into. Set it on the class
+            (rather than in `__init__`) to let `MigrationRunner` find the
+            migration and work out its dependencies.
         `data` and `m2m_data` is where the data from the original database
             is stored.
         `m2m`, a mapping of info needed for related m2m inserts:
@@ -269,14 +580,31 @@ class Migration(object):
         `unique_field` is a value from the source database that has to be
             unique for insertion to work.
         `delete_existing`, if True model will be emptied before inserting.
+        `bulk_load`, if True the non-unique indexes of the model's table are
+            dropped and its foreign key checks are deferred while inserting.
+            Afterwards the indexes are rebuilt and the foreign keys validated
+            in one go. Supported on SQLite and PostgreSQL; problems are
+            reported through `log`.
+        `fast_reset`, if True the model is emptied with raw SQL instead of
+            the ORM's `delete()`: `TRUNCATE` on PostgreSQL and `DELETE` in
+            chunks of `reset_chunk_size` rows elsewhere. Relations to the
+            model are handled according to their `on_delete`: CASCADE,
+            SET_NULL, SET_DEFAULT, PROTECT and DO_NOTHING are done in SQL,
+            anything else falls back to `delete()`. No signals are sent.
+        `batch_size`, the number of rows `insert_batches` holds in `data` at a
+            time.
     """
+    model = None
     unique_field = 'id'
+    bulk_load = False
+    fast_reset = False
+    reset_chunk_size = 500
+    batch_size = 10000
 
     def __init__(self, **kwargs):
         """
         Set instance variables by subclassing Migrate.
         """
-        self.model = None
         self.data = []
         self.deleted_data = []
         self.rel = []
@@ -285,6 +613,9 @@ class Migration(object):
         self.get_or_create = False
         self.instances_prepared = False
         self.m2m_prepared = False
+        self.dropped_indexes = []
+        self.dropped_constraints = []
+        self.foreign_keys_disabled = False
 
     def get_rel_model(self, field_name):
         """ Get related model """
@@ -343,7 +674,7 @@ class Migration(object):
         for i, dic in enumerate(self.data):
             delete = True
             for key, value in dic.items():
-                if key in fields and value.strip():
+                if key in fields and not is_empty(value):
                     delete = False
                     break
             if delete:
@@ -402,12 +733,12 @@ class Migration(object):
                     assert len(regex) is 2, 'Please supply 2-tuple ' \
                         '(regex, repl) only as value.'
                     regex, repl = regex
-                if isinstance(dic[field], basestring):
-                    dic[field] = [dic[field]]
+                if dic[field] is None:
+                    continue
                 values = []
-                for val in dic[field]:
-                    values.append(re.sub(regex, repl, val))
-                dic[field] = values[0] if len(dic[field]) is 1 else values
+                for val in to_list(dic[field]):
+                    values.append(re.sub(regex, repl, to_text(val)))
+                dic[field] = values[0] if len(values) is 1 else values
 
                 self.log.add(
                     msg=u'Cleaned {} using u"{}"'.format(field, regex))
@@ -421,7 +752,8 @@ class Migration(object):
                 if isinstance(values, basestring):
                     values = [values]
                 for val in values:
-                    if dic[key].strip().lower() == val.lower():
+                    value = u'' if dic[key] is None else unicode(dic[key])
+                    if value.strip().lower() == val.lower():
                         self.log.add(affected=dic[self.unique_field],
                             msg=u'Filter match: {}="{}"'.format(key, val))
                         items_to_del.append(i)
@@ -492,15 +824,13 @@ class Migration(object):
                         pass
                     
 
-                if isinstance(values, basestring):
-                    values = [values]
                 if isinstance(values, Model):
                     continue
 
-                for value in values:
+                for value in to_list(values):
                     if isinstance(value, Model):
                         break
-                    if not value:
+                    if is_empty(value):
                         self.log.add(msg=u'Empty value on "{}".'.format(field),
                             affected=unique_id)
                         continue
@@ -564,14 +894,15 @@ class Migration(object):
                 new_key = m2m['field']
 
                 # Split on supplied regex
-                dic[new_key] = re.split(m2m.get('split', ''), dic.get(key, ''))
+                dic[new_key] = re.split(m2m.get('split', ''),
+                                        to_text(dic.get(key)))
 
                 # Return the values of the items with the key name specified
                 # in m2m['key_list'].
                 if m2m.get('key_list'):
                     for m2m_key in m2m['key_list']:
-                        if dic[m2m_key]:
-                            dic[new_key].append(dic[m2m_key].strip())
+                        if not is_empty(dic[m2m_key]):
+                            dic[new_key].append(to_text(dic[m2m_key]).strip())
 
                 # Return the keys of the items whos values don't evaluate to
                 # False.
@@ -588,8 +919,259 @@ class Migration(object):
 
         self.m2m_prepared = True
 
+    def execute_sql(self, sql, params=None):
+        """ Execute raw SQL on the default database and return the rows. """
+        cursor = connection.cursor()
+        cursor.execute(sql, params or [])
+        # `description` is None for statements that don't return rows.
+        rows = cursor.fetchall() if cursor.description is not None else []
+        # Only needed for Django versions that don't autocommit.
+        getattr(transaction, 'commit_unless_managed', lambda: None)()
+        return rows
+
+    def begin_bulk_load(self):
+        """ Drop non-unique indexes and defer foreign key checks. """
+        table = self.model._meta.db_table
+        qn = connection.ops.quote_name
+
+        if connection.vendor == 'sqlite':
+            # Rows are (seq, name, unique, ...). Unique indexes are kept so
+            # that duplicates can't get in while loading.
+            names = [row[1] for row in self.execute_sql(
+                'PRAGMA index_list({})'.format(qn(table))) if not row[2]]
+            # Indexes without sql are created for PRIMARY KEY / UNIQUE.
+            self.dropped_indexes = [row for row in self.execute_sql(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name = %s AND sql IS NOT NULL", [table])
+                if row[0] in names]
+            for name, sql in self.dropped_indexes:
+                self.execute_sql('DROP INDEX {}'.format(qn(name)))
+            if self.execute_sql('PRAGMA foreign_keys')[0][0]:
+                self.execute_sql('PRAGMA foreign_keys = OFF')
+                self.foreign_keys_disabled = True
+        elif connection.vendor == 'postgresql':
+            self.dropped_indexes = self.execute_sql(
+                'SELECT c.relname, pg_get_indexdef(i.indexrelid) '
+                'FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+                'WHERE i.indrelid = %s::regclass '
+                'AND NOT i.indisprimary AND NOT i.indisunique', [qn(table)])
+            self.dropped_constraints = self.execute_sql(
+                'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+                "WHERE conrelid = %s::regclass AND contype = 'f'", [qn(table)])
+            for name, definition in self.dropped_constraints:
+                self.execute_sql('ALTER TABLE {} DROP CONSTRAINT {}'.format(
+                    qn(table), qn(name)))
+            for name, sql in self.dropped_indexes:
+                self.execute_sql('DROP INDEX {}'.format(qn(name)))
+        else:
+            self.log.add(msg=u'Bulk load is not supported on {}, inserting '
+                'normally.'.format(connection.vendor))
+            return
+
+        print u'Dropped {} indexes and {} foreign keys on `{}`.'.format(
+            len(self.dropped_indexes), len(self.dropped_constraints), table)
+
+    def end_bulk_load(self):
+        """ Rebuild indexes and validate foreign keys dropped by
+        `begin_bulk_load`. Anything that fails is added to the log.
+        """
+        table = self.model._meta.db_table
+        qn = connection.ops.quote_name
+
+        for name, sql in self.dropped_indexes:
+            try:
+                self.execute_sql(sql)
+            except DatabaseError as e:
+                connection.close()
+                self.log.add(msg=u"Couldn't rebuild index {}.".format(name),
+                    exception=e)
+        self.dropped_indexes = []
+
+        # Foreign keys are added back without checking the existing rows, so
+        # they are restored even if some rows turn out to be invalid.
+        restored = []
+        for name, definition in self.dropped_constraints:
+            try:
+                self.execute_sql('ALTER TABLE {} ADD CONSTRAINT {} {} '
+                    'NOT VALID'.format(qn(table), qn(name), definition))
+            except DatabaseError as e:
+                connection.close()
+                self.log.add(msg=u"Couldn't restore foreign key {}: "
+                    "{}".format(name, e), exception=e)
+                continue
+            restored.append(name)
+        for name in restored:
+            try:
+                self.execute_sql('ALTER TABLE {} VALIDATE CONSTRAINT '
+                    '{}'.format(qn(table), qn(name)))
+            except (DatabaseError, IntegrityError) as e:
+                connection.close()
+                self.log.add(msg=u"Foreign key {} failed validation: "
+                    "{}".format(name, e), exception=e)
+        self.dropped_constraints = []
+
+        if self.foreign_keys_disabled:
+            self.execute_sql('PRAGMA foreign_keys = ON')
+            self.foreign_keys_disabled = False
+            # Rows are (table, rowid, parent table, foreign key index)
+            for row in self.execute_sql(
+                    'PRAGMA foreign_key_check({})'.format(qn(table))):
+                self.log.add(affected=row[1], msg=u'Foreign key references '
+                    'missing row in `{}`.'.format(row[2]))
+
+        print u'Rebuilt indexes on `{}`.'.format(table)
+
+    def get_reset_plan(self, model=None, seen=None):
+        """ Work out how to empty `model` like the ORM's `delete()` would.
+        Returns a 2-tuple (models, relations). `models` are the models whose
+        rows are deleted, ordered so that dependent models come before the
+        models they depend on, including the m2m tables. `relations` are the
+        (model, field, on_delete) of the foreign keys that aren't cascaded.
+        Raises ProtectedError if a PROTECT relation has rows and
+        UnsupportedOnDelete for `on_delete` handlers that can't be done in SQL.
+        """
+        model = model or self.model
+        seen = seen if seen is not None else set()
+        if model in seen:
+            return [], []
+        seen.add(model)
+
+        opts = model._meta
+        models, relations = [], []
+        for rel in opts.get_all_related_objects(include_hidden=True):
+            rel_model, field = rel.model, rel.field
+            on_delete = getattr(field.rel, 'on_delete', CASCADE)
+            if on_delete is CASCADE:
+                sub_plan = self.get_reset_plan(rel_model, seen)
+                models += sub_plan[0]
+                relations += sub_plan[1]
+                continue
+            if on_delete is PROTECT:
+                protected = rel_model._default_manager.filter(
+                    **{'{}__isnull'.format(field.name): False})
+                if protected.exists():
+                    raise ProtectedError(u"Can't empty {} as {}.{} is "
+                        "protected.".format(opts.db_table,
+                        rel_model._meta.db_table, field.column), protected)
+            elif on_delete not in (SET_NULL, SET_DEFAULT, DO_NOTHING):
+                raise UnsupportedOnDelete(u'Unsupported on_delete on '
+                    '{}.{}.'.format(rel_model._meta.db_table, field.column))
+            relations.append((rel_model, field, on_delete))
+
+        through = [field.rel.through for field in opts.many_to_many]
+        through += [rel.field.rel.through for rel in
+                    opts.get_all_related_many_to_many_objects()]
+        for rel_model in through:
+            models += self.get_reset_plan(rel_model, seen)[0]
+        return models + [model], relations
+
+    def delete_in_chunks(self, model):
+        """ Delete all rows of `model` with raw `DELETE` statements. """
+        qn = connection.ops.quote_name
+        table, pk = qn(model._meta.db_table), qn(model._meta.pk.column)
+        while True:
+            pks = [row[0] for row in self.execute_sql(
+                'SELECT {} FROM {} LIMIT %s'.format(pk, table),
+                [self.reset_chunk_size])]
+            if not pks:
+                break
+            self.execute_sql('DELETE FROM {} WHERE {} IN ({})'.format(
+                table, pk, ', '.join(['%s'] * len(pks))), pks)
+
+    def reset_model(self):
+        """ Empty `model` and its dependent models without the ORM.
+        Falls back to `delete()` if a relation's `on_delete` can't be done in
+        SQL.
+        """
+        qn = connection.ops.quote_name
+        try:
+            plan, relations = self.get_reset_plan()
+        except UnsupportedOnDelete as e:
+            self.log.add(msg=u'{} Using delete() instead.'.format(e),
+                exception=e)
+            self.model.objects.all().delete()
+            return
+
+        models, tables = [], []
+        for model in plan:
+            if model._meta.proxy or model._meta.db_table in tables:
+                continue
+            models.append(model)
+            tables.append(model._meta.db_table)
+
+        for rel_model, field, on_delete in relations:
+            if on_delete not in (SET_NULL, SET_DEFAULT):
+                continue # Left as is for PROTECT and DO_NOTHING
+            if rel_model._meta.db_table in tables:
+                continue
+            value = None if on_delete is SET_NULL else field.get_default()
+            self.execute_sql('UPDATE {0} SET {1} = %s WHERE {1} IS NOT '
+                'NULL'.format(qn(rel_model._meta.db_table),
+                qn(field.column)), [value])
+
+        # TRUNCATE fails if any other table references the truncated ones.
+        if connection.vendor == 'postgresql' and not relations:
+            self.execute_sql('TRUNCATE {}'.format(
+                ', '.join([qn(table) for table in tables])))
+        else:
+            for model in models:
+                self.delete_in_chunks(model)
+        print u'Emptied {}.'.format(', '.join(tables))
+
+    def reset(self):
+        """ Empty `model` before inserting. """
+        if self.fast_reset:
+            self.reset_model()
+        else:
+            self.model.objects.all().delete()
+
+    def prepare_batch(self):
+        """ Called by `insert_batches` with each batch of rows in `data`.
+        Override to clean the rows, e.g. with `delete_if_all_empty`,
+        `filter_data` or `sub_text`.
+        """
+        pass
+
+    def insert_batches(self, rows):
+        """ Insert the rows of an iterable, `batch_size` rows at a time.
+        Use this for `Data.merged_data` when `Data.external_merge` is True, as
+        only one batch is kept in memory. Methods that compare rows with each
+        other, like `get_duplicates` and `item_exists`, only see the current
+        batch.
+        """
+        if self.bulk_load:
+            self.begin_bulk_load()
+        try:
+            self.reset()
+            rows = iter(rows)
+            while True:
+                self.data = list(itertools.islice(rows, self.batch_size))
+                if not self.data:
+                    break
+                self.prepare_batch()
+                if not self.data:
+                    continue # Everything was filtered out
+                self.prep_m2m()
+                self.prep_model_instances()
+                self._insert()
+        finally:
+            if self.bulk_load:
+                self.end_bulk_load()
+
     def insert(self, **kwargs):
-        """ Do the actual inserting. """
+        """ Do the actual inserting.
+        If `bulk_load` is True, indexes and foreign key checks are disabled
+        for the duration of the insert.
+        """
+        if not self.bulk_load or kwargs.get('after', False):
+            return self._insert(**kwargs)
+        self.begin_bulk_load()
+        try:
+            self._insert(**kwargs)
+        finally:
+            self.end_bulk_load()
+
+    def _insert(self, **kwargs):
         after = kwargs.get('after', False)
 
         # Prepare m2m data if it hasn't been already
@@ -597,7 +1179,7 @@ class Migration(object):
             self.prep_m2m()
 
         if not self.instances_prepared:
-            self.model.objects.all().delete()
+            self.reset()
             self.prep_model_instances()
 
         insert_after_fields = set(self.insert_after_fields())
@@ -633,7 +1215,7 @@ class Migration(object):
                 if after is True:
                     obj = self.model.objects.get(**{self.unique_field: unique_id})
                     for key, val in obj_kwargs.items():
-                        if val:
+                        if not is_empty(val):
                             setattr(obj, key, val)
                     obj.save()
                 elif self.get_or_create is True:
@@ -687,8 +1269,9 @@ class Log(object):
             print u'"{}" is not a valid keyword argument.'.format(kwarg)
 
         if not isinstance(affected, (list, set, tuple)):
-            affected = [unicode(affected)]
-        dic = dict(affected=list(affected), msg=msg, exceptions=[])
+            affected = [affected]
+        affected = [unicode(item) for item in affected]
+        dic = dict(affected=affected, msg=msg, exceptions=[])
         if exception and exception not in dic['exceptions']:
             dic['exceptions'].append(exception)
         # Add affected item(s) if not in list
@@ -0,0 +1,217 @@
+import time
+import traceback
+import multiprocessing
+from django.db import connection
+from soupmigration.base import Migration, Log
+
+__all__ = ['MigrationRunner']
+
+
+def get_migrations(base=Migration):
+    """ Return all subclasses of `base` that have a `model` set. """
+    migrations = []
+    for cls in base.__subclasses__():
+        if cls.model is not None:
+            migrations.append(cls)
+        migrations += [m for m in get_migrations(cls) if m not in migrations]
+    return migrations
+
+
+def get_related_models(model, nullable=True):
+    """ Return the models that `model` has foreign keys or m2m fields to.
+    Foreign keys that allow NULL are left out if `nullable` is False.
+    """
+    opts = model._meta
+    related = set()
+    fields = list(opts.many_to_many)
+    fields += [f for f in opts.fields if nullable or not f.null]
+    for field in fields:
+        to = getattr(field.rel, 'to', None)
+        if to is not None and to is not model:
+            related.add(to)
+    return related
+
+
+def run_migration(migration_class):
+    """ Instantiate and insert `migration_class` in a worker process.
+    Returns a picklable dict with the timing, log messages and error, if any.
+    """
+    # Don't share the parent process' database connection.
+    connection.close()
+    result = dict(migration=migration_class, error=None, log=[])
+    start = time.time()
+    try:
+        migration = migration_class()
+        migration.insert()
+        for dic in migration.log.log_messages:
+            result['log'].append(dict(dic,
+                exceptions=[repr(e) for e in dic['exceptions']]))
+    except Exception:
+        result['error'] = traceback.format_exc()
+    finally:
+        connection.close()
+    result['seconds'] = time.time() - start
+    return result
+
+
+class MigrationRunner(object):
+    """ Run several migrations in parallel, in dependency order.
+
+    A migration depends on another one if its `model` has a foreign key or
+    m2m field to the other migration's `model`. Each migration is run in its
+    own process (and thereby with its own database connection) as soon as
+    the migrations it depends on have finished, at most `processes` at a
+    time. Dependents of a failed migration are skipped.
+
+    Circular dependencies are broken by first ignoring foreign keys that
+    allow NULL, and as a last resort by starting the migration with the
+    fewest unfinished dependencies. Both are added to the log.
+
+    If `timeout` is given, a migration still running after that many seconds
+    is counted as failed.
+
+    `migrations` defaults to all subclasses of `Migration` that have `model`
+    set on the class. They need to be importable by the worker processes,
+    i.e. defined at module level.
+
+    After `run`, `timings` maps each migration's name to the seconds it took
+    and `log` contains the messages of all migrations, prefixed with the
+    migration's name. Use `report` to print both.
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, migrations=None, processes=None, timeout=None):
+        self.migrations = list(migrations or get_migrations())
+        self.processes = processes or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.dependencies = self.get_dependencies()
+        self.required_dependencies = self.get_dependencies(nullable=False)
+        self.timings = {}
+        self.total_seconds = 0
+        self.log = Log()
+
+    def get_dependencies(self, nullable=True):
+        """ Map each migration to the set of migrations it depends on. """
+        by_model = dict((m.model, m) for m in self.migrations)
+        dependencies = {}
+        for migration in self.migrations:
+            related = get_related_models(migration.model, nullable)
+            dependencies[migration] = set([by_model[model] for model in
+                                           related if model in by_model])
+            dependencies[migration].discard(migration)
+        return dependencies
+
+    def add_result(self, result):
+        """ Add the timing and log messages of a finished migration. """
+        name = result['migration'].__name__
+        self.timings[name] = result['seconds']
+        for dic in result['log']:
+            self.log.add(msg=u'{}: {}'.format(name, dic['msg']),
+                affected=dic['affected'])
+        if result['error']:
+            self.log.add(msg=u'{} failed:\n{}'.format(name, result['error']))
+
+    def get_ready(self, pending, done, running):
+        """ Return the pending migrations that can be started. """
+        ready = [m for m in pending if self.dependencies[m] <= done]
+        if ready or running or not pending:
+            return ready
+
+        # Nothing can run, so there are circular dependencies.
+        ready = [m for m in pending if self.required_dependencies[m] <= done]
+        if ready:
+            self.log.add(affected=[m.__name__ for m in ready],
+                msg=u'Started before the migrations it has nullable foreign '
+                    'keys to, due to circular dependencies.')
+            return ready
+        migration = min(pending,
+                        key=lambda m: len(self.dependencies[m] - done))
+        self.log.add(affected=migration.__name__,
+            msg=u'Started before its dependencies had finished, due to '
+                'circular dependencies.')
+        return [migration]
+
+    def wait(self, running):
+        """ Wait for one or more migrations in `running` to finish and
+        return their results. `running` maps the AsyncResult of each running
+        migration to its (migration, start time).
+        """
+        while True:
+            results = []
+            for async_result, (migration, start) in running.items():
+                seconds = time.time() - start
+                if async_result.ready():
+                    try:
+                        result = async_result.get()
+                    except Exception:
+                        result = dict(migration=migration, log=[],
+                            error=traceback.format_exc(), seconds=seconds)
+                elif self.timeout and seconds > self.timeout:
+                    result = dict(migration=migration, log=[],
+                        error=u'Timed out after {:.0f}s.'.format(seconds),
+                        seconds=seconds)
+                else:
+                    continue
+                del running[async_result]
+                results.append(result)
+            if results:
+                return results
+            time.sleep(self.poll_interval)
+
+    def run(self):
+        """ Run all migrations. """
+        pending = set(self.migrations)
+        done, failed = set(), set()
+        running = {}
+        start = time.time()
+
+        # Forked workers would otherwise inherit the open connection.
+        connection.close()
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            while pending or running:
+                # Repeat until no more are skipped, so dependents of skipped
+                # migrations are skipped too.
+                skipped = True
+                while skipped:
+                    skipped = [m for m in pending
+                               if self.dependencies[m] & failed]
+                    for migration in skipped:
+                        pending.remove(migration)
+                        failed.add(migration)
+                        self.log.add(affected=migration.__name__,
+                            msg=u'Skipped as a migration it depends on '
+                                'failed.')
+
+                for migration in self.get_ready(pending, done, running):
+                    pending.remove(migration)
+                    async_result = pool.apply_async(run_migration,
+                                                    (migration,))
+                    running[async_result] = (migration, time.time())
+                    print u'Started {}.'.format(migration.__name__)
+
+                if not running:
+                    continue
+
+                for result in self.wait(running):
+                    self.add_result(result)
+                    if result['error']:
+                        failed.add(result['migration'])
+                    else:
+                        done.add(result['migration'])
+                    print u'Finished {} in {:.1f}s.'.format(
+                        result['migration'].__name__, result['seconds'])
+        finally:
+            # Timed out workers may still be running.
+            pool.terminate()
+            pool.join()
+        self.total_seconds = time.time() - start
+
+    def report(self):
+        """ Print the timings of all migrations followed by the log. """
+        for name, seconds in sorted(self.timings.items(),
+                                    key=lambda item: -item[1]):
+            print u'{}: {:.1f}s'.format(name, seconds)
+        print u'Total: {:.1f}s'.format(self.total_seconds)
+        self.log.print_all()
@@ -41,3 +41,32 @@ def remove_lookup_type(lookup_dict):
     name__istartswith='apple' --> name='apple'
     """
     return {re.sub('__.*', '', k): v for k, v in lookup_dict.iteritems()}
+
+
+def is_empty(value):
+    """Return True if `value` is None or a string containing only whitespace.
+    Other values, e.g. 0 or False, are not considered empty.
+    """
+    if value is None:
+        return True
+    return isinstance(value, basestring) and not value.strip()
+
+
+def to_text(value):
+    """Return `value` as a unicode string, with None as an empty string."""
+    if value is None:
+        return u''
+    if isinstance(value, basestring):
+        return value
+    return unicode(value)
+
+
+def to_list(value):
+    """Return `value` as a list.
+    None gives an empty list and other non-sequence values a 1-item list.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
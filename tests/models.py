@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=100, db_index=True)
+
+
+class Product(models.Model):
+    code = models.CharField(max_length=20)
+    name = models.CharField(max_length=100, db_index=True)
+    category = models.ForeignKey(Category, null=True)
+
+
+class Review(models.Model):
+    product = models.ForeignKey(Product)
+    text = models.TextField()
+
+
+class Shelf(models.Model):
+    name = models.CharField(max_length=100)
+    category = models.ForeignKey(Category, null=True, related_name='+',
+                                 on_delete=models.SET_NULL)
+
+
+class Label(models.Model):
+    category = models.ForeignKey(Category, on_delete=models.PROTECT)
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=100)
+    best_book = models.ForeignKey('Book', null=True, related_name='+',
+                                  on_delete=models.SET_NULL)
+
+
+class Book(models.Model):
+    title = models.CharField(max_length=100)
+    author = models.ForeignKey(Author)
+
+
+class Sticker(models.Model):
+    label = models.ForeignKey(Label, null=True, on_delete=models.SET(None))
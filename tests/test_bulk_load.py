@@ -0,0 +1,106 @@
+from unittest import skipUnless
+from django.db import connection
+from django.test import TransactionTestCase
+from soupmigration.base import Migration
+from tests.models import Category, Product
+
+SUPPORTED = connection.vendor in ('sqlite', 'postgresql')
+
+
+class ProductMigration(Migration):
+    model = Product
+    bulk_load = True
+
+    def __init__(self, data):
+        super(ProductMigration, self).__init__()
+        self.data = data
+        self.rel = [{'field': 'category', 'lookup_fields': ['name']}]
+
+
+def index_names(table):
+    cursor = connection.cursor()
+    if connection.vendor == 'sqlite':
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                       "AND tbl_name = %s", [table])
+    else:
+        cursor.execute('SELECT indexname FROM pg_indexes '
+                       'WHERE tablename = %s', [table])
+    return set([row[0] for row in cursor.fetchall()])
+
+
+def foreign_key_names(table):
+    cursor = connection.cursor()
+    cursor.execute("SELECT conname FROM pg_constraint WHERE contype = 'f' "
+                   "AND conrelid = %s::regclass", [table])
+    return set([row[0] for row in cursor.fetchall()])
+
+
+@skipUnless(SUPPORTED, 'Bulk load is only supported on SQLite and PostgreSQL')
+class BulkLoadTest(TransactionTestCase):
+
+    def setUp(self):
+        self.table = Product._meta.db_table
+        cursor = connection.cursor()
+        cursor.execute('CREATE UNIQUE INDEX product_code_uniq ON {} '
+                       '(code)'.format(connection.ops.quote_name(self.table)))
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA foreign_keys = ON')
+        self.indexes = index_names(self.table)
+        self.category = Category.objects.create(name=u'Fruit')
+
+    def tearDown(self):
+        cursor = connection.cursor()
+        cursor.execute('DROP INDEX product_code_uniq')
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+    def test_only_non_unique_indexes_are_dropped(self):
+        migration = ProductMigration([])
+        migration.begin_bulk_load()
+        indexes = index_names(self.table)
+        self.assertIn('product_code_uniq', indexes)
+        self.assertTrue(len(indexes) < len(self.indexes))
+        migration.end_bulk_load()
+        self.assertEqual(index_names(self.table), self.indexes)
+        self.assertEqual(migration.log.log_messages, [])
+
+    def test_insert(self):
+        migration = ProductMigration([
+            {'id': u'1', 'code': u'A1', 'name': u'Apple',
+             'category': u'Fruit'},
+            {'id': u'2', 'code': u'B1', 'name': u'Banana',
+             'category': u'Fruit'},
+        ])
+        migration.insert()
+        self.assertEqual(Product.objects.filter(
+            category=self.category).count(), 2)
+        self.assertEqual(index_names(self.table), self.indexes)
+        self.assertEqual(migration.log.log_messages, [])
+
+    def test_invalid_foreign_key_is_logged(self):
+        if connection.vendor == 'postgresql':
+            foreign_keys = foreign_key_names(self.table)
+        migration = ProductMigration([])
+        migration.begin_bulk_load()
+        connection.cursor().execute(
+            'INSERT INTO {} (code, name, category_id) VALUES '
+            "('X1', 'Broken', 999)".format(
+                connection.ops.quote_name(self.table)))
+        migration.end_bulk_load()
+        self.assertEqual(len(migration.log.log_messages), 1)
+        self.assertEqual(index_names(self.table), self.indexes)
+        if connection.vendor == 'postgresql':
+            # The foreign key is restored even though it didn't validate.
+            self.assertEqual(foreign_key_names(self.table), foreign_keys)
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+    def test_failed_foreign_key_restore_is_logged(self):
+        foreign_keys = foreign_key_names(self.table)
+        migration = ProductMigration([])
+        migration.begin_bulk_load()
+        migration.dropped_constraints.insert(0, (
+            'broken_fk', 'FOREIGN KEY (missing_id) REFERENCES missing (id)'))
+        migration.end_bulk_load()
+        # The other foreign keys are still restored.
+        self.assertEqual(foreign_key_names(self.table), foreign_keys)
+        self.assertEqual(len(migration.log.log_messages), 1)
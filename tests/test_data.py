@@ -0,0 +1,172 @@
+from django.test import SimpleTestCase
+from soupmigration.base import Data, Log
+from tests.models import Product
+
+
+def make_data(**attrs):
+    """ Return a `Data` instance without running `__init__`, which connects
+    to the MySQL database.
+    """
+    data = Data.__new__(Data)
+    data.tables = []
+    data.data = {}
+    data.runs = {}
+    data.converters = {}
+    data.empty_defaults = {}
+    data.merged_data = []
+    data.log = Log()
+    data.empty_values = [None, 'None', 'NULL', '0']
+    data.sample_cutoff = None
+    for key, value in attrs.items():
+        setattr(data, key, value)
+    return data
+
+
+class TypedTest(SimpleTestCase):
+
+    def setUp(self):
+        self.data = make_data(typed=True, unique_field=('id', 'uid'),
+            mapping={'all': {'id': 'uid'}, 'product': {
+                'stock': None, 'code': None, 'title': 'name'}})
+        # Rows of DESCRIBE are (Field, Type, Null, Key, Default, Extra)
+        self.data.build_converters('product', [
+            ('id', 'int(11)', 'NO', 'PRI', None, ''),
+            ('stock', 'int(11)', 'YES', '', None, ''),
+            ('code', 'varchar(20)', 'YES', '', None, ''),
+            ('title', 'int(11)', 'YES', '', None, ''),
+        ])
+
+    def convert(self, **row):
+        return self.data.convert_row('product', row)
+
+    def test_numeric_zero_is_kept(self):
+        row = self.convert(id=1, stock=0, code=u' 0 ', title=None)
+        self.assertEqual(row['stock'], 0)
+        self.assertEqual(row['code'], u'')
+
+    def test_empty_defaults(self):
+        self.data.fold_all_mapping()
+        default_dic = self.data._get_default_dic()
+        self.assertEqual(default_dic['stock'], None)
+        self.assertEqual(default_dic['code'], u'')
+        row = self.convert(id=1, stock=u'  ', code=None, title=None)
+        self.assertEqual(row['stock'], None)
+        self.assertEqual(row['code'], u'')
+
+    def test_model_field_type(self):
+        self.data.model = Product
+        self.data.build_converters('product', [('title', 'int(11)')])
+        self.assertEqual(self.convert(title=5)['title'], u'5')
+
+    def test_unique_field_has_same_type_in_all_tables(self):
+        data = make_data(typed=True, unique_field=('id', 'uid'),
+            mapping={'all': {'id': 'uid'}, 'a': {'x': None},
+                     'b': {'y': None}})
+        data.build_converters('a', [('id', 'int(11)'), ('x', 'int(11)')])
+        data.build_converters('b', [('id', 'varchar(10)'),
+                                    ('y', 'varchar(10)')])
+        row_a = data.convert_row('a', {'id': 1, 'x': 0})
+        row_b = data.convert_row('b', {'id': u'1', 'y': u'y'})
+        data.data = {'a': [data.map_row('a', row_a)],
+                     'b': [data.map_row('b', row_b)]}
+        data.merge()
+        self.assertEqual(data.merged_data, [{'uid': u'1', 'x': 0, 'y': u'y'}])
+
+
+class ExternalMergeTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tables = {
+            'customer': [
+                {'uid': u'3', 'name': u'Carl', 'city': u''},
+                {'uid': u'1', 'name': u'', 'city': u'Oslo'},
+                {'uid': u'2', 'name': u'Bea', 'city': u'Rome'},
+                # Duplicate key, the later row wins
+                {'uid': u'3', 'name': u'Carla', 'city': u''},
+                {'uid': u'', 'name': u'No key', 'city': u''},
+            ],
+            'legacy': [
+                {'uid': u'1', 'name': u'Anna', 'city': u'Bergen'},
+                {'uid': u'3', 'name': u'Old Carl', 'city': u'Lund'},
+                {'uid': u'4', 'name': u'Dan', 'city': u' '},
+                {'uid': u'1', 'name': u'Ann', 'city': u''},
+            ],
+        }
+        mapping = {'customer': {'name': None, 'city': None},
+                   'legacy': {'name': None, 'city': None}}
+        self.attrs = dict(unique_field=('id', 'uid'), mapping=mapping,
+                          table_order=['customer', 'legacy'],
+                          tables=['customer', 'legacy'])
+
+    def test_same_result_as_merge(self):
+        in_memory = make_data(**self.attrs)
+        in_memory.data = dict([(table, [dict(row) for row in rows])
+                               for table, rows in self.tables.items()])
+        in_memory.merge()
+
+        external = make_data(external_merge=True, **self.attrs)
+        for table, rows in self.tables.items():
+            rows = [dict(row) for row in rows]
+            # Several runs per table
+            external.runs[table] = [external.write_run(rows[:2]),
+                                    external.write_run(rows[2:])]
+        external.merge()
+        merged = list(external.merged_data)
+
+        self.assertEqual(merged, in_memory.merged_data)
+        self.assertEqual(merged, [
+            {'uid': u'1', 'name': u'Ann', 'city': u'Oslo'},
+            {'uid': u'2', 'name': u'Bea', 'city': u'Rome'},
+            {'uid': u'3', 'name': u'Carla', 'city': u'Lund'},
+            {'uid': u'4', 'name': u'Dan', 'city': u''},
+        ])
+        self.assertEqual(external.runs, {})
+
+
+class FakeCursor(object):
+    """ Records queries and returns the given `MAX()` results in turn. """
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.queries = []
+
+    def execute(self, sql, params):
+        self.queries.append((sql, params))
+
+    def fetchone(self):
+        return [self.results.pop(0)]
+
+
+class SampleTest(SimpleTestCase):
+
+    def make_data(self, cursor, **attrs):
+        return make_data(unique_field=('id', 'uid'), cursor=cursor,
+                         tables=['a', 'b'], **attrs)
+
+    def test_no_sampling(self):
+        data = self.make_data(FakeCursor())
+        self.assertEqual(data.get_select_sql('a'), ('SELECT * FROM `a`', []))
+
+    def test_modulo(self):
+        data = self.make_data(FakeCursor(), sample_modulo=10)
+        sql, params = data.get_select_sql('a')
+        self.assertEqual(sql, 'SELECT * FROM `a` WHERE CRC32(`id`) %% 10 = 0')
+        # MySQLdb interpolates params with %, leaving a single %.
+        self.assertEqual(sql % tuple(params),
+                         'SELECT * FROM `a` WHERE CRC32(`id`) % 10 = 0')
+
+    def test_cutoff_with_modulo(self):
+        cursor = FakeCursor(None, 42)
+        data = self.make_data(cursor, sample_modulo=10, sample_limit=5,
+                              table_order=['b', 'a'])
+        data.sample_cutoff = data.get_sample_cutoff()
+        self.assertEqual(data.sample_cutoff, 42)
+        # Table `b` comes first in `table_order` but has no rows.
+        self.assertEqual(cursor.queries, [
+            ('SELECT MAX(`id`) FROM (SELECT `id` FROM `{}` WHERE CRC32(`id`) '
+             '%% 10 = 0 ORDER BY `id` LIMIT 5) AS sample'.format(table), [])
+            for table in ('b', 'a')])
+        for table in ('a', 'b'):
+            self.assertEqual(data.get_select_sql(table), (
+                'SELECT * FROM `{}` WHERE CRC32(`id`) %% 10 = 0 AND '
+                '`id` <= %s'.format(table), [42]))
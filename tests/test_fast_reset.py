@@ -0,0 +1,53 @@
+from django.db.models.deletion import ProtectedError
+from django.test import TransactionTestCase
+from soupmigration.base import Migration
+from tests.models import Category, Product, Shelf, Label, Sticker
+
+
+class CategoryMigration(Migration):
+    model = Category
+    fast_reset = True
+
+
+class LabelMigration(Migration):
+    model = Label
+    fast_reset = True
+
+
+class FastResetTest(TransactionTestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name=u'Fruit')
+        Product.objects.create(code=u'A1', name=u'Apple',
+                               category=self.category)
+        self.shelf = Shelf.objects.create(name=u'Top', category=self.category)
+
+    def test_on_delete_is_honoured(self):
+        CategoryMigration().reset()
+        self.assertFalse(Category.objects.exists())
+        self.assertFalse(Product.objects.exists())
+        # Hidden SET_NULL relations are nulled, not deleted.
+        self.assertEqual(Shelf.objects.get(pk=self.shelf.pk).category_id,
+                         None)
+
+    def test_protected_relation_raises(self):
+        Label.objects.create(category=self.category)
+        self.assertRaises(ProtectedError, CategoryMigration().reset)
+        self.assertTrue(Category.objects.exists())
+        self.assertTrue(Product.objects.exists())
+
+    def test_protected_relation_without_rows(self):
+        migration = CategoryMigration()
+        migration.reset()
+        self.assertFalse(Category.objects.exists())
+        self.assertEqual(migration.log.log_messages, [])
+
+    def test_unsupported_on_delete_falls_back_to_delete(self):
+        label = Label.objects.create(category=self.category)
+        sticker = Sticker.objects.create(label=label)
+        migration = LabelMigration()
+        migration.reset()
+        self.assertFalse(Label.objects.exists())
+        # Done by delete(), as SET() can't be done in SQL.
+        self.assertEqual(Sticker.objects.get(pk=sticker.pk).label_id, None)
+        self.assertEqual(len(migration.log.log_messages), 1)
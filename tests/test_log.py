@@ -0,0 +1,13 @@
+from django.test import SimpleTestCase
+from soupmigration.base import Log
+
+
+class LogTest(SimpleTestCase):
+
+    def test_affected_items_are_unicode(self):
+        log = Log()
+        log.add(msg=u'Failed.', affected=[1, u'2'])
+        log.add(msg=u'Failed.', affected=3)
+        self.assertEqual(log.log_messages[0]['affected'], [u'1', u'2', u'3'])
+        self.assertEqual(log.msg_repr(log.log_messages[0]),
+                         u'Log(Failed.: 1, 2, 3)')
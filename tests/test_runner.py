@@ -0,0 +1,81 @@
+from django.test import SimpleTestCase
+from soupmigration.base import Migration
+from soupmigration.runner import MigrationRunner
+from tests.models import Category, Product, Review, Author, Book
+
+
+class FakeMigration(Migration):
+    """ Logs instead of inserting. """
+
+    def insert(self, **kwargs):
+        self.log.add(msg=u'Inserted.')
+
+
+class CategoryMigration(FakeMigration):
+    model = Category
+
+    def insert(self, **kwargs):
+        raise ValueError('Broken source data')
+
+
+class ProductMigration(FakeMigration):
+    model = Product
+
+
+class ReviewMigration(FakeMigration):
+    model = Review
+
+
+class AuthorMigration(FakeMigration):
+    model = Author
+
+
+class BookMigration(FakeMigration):
+    model = Book
+
+
+class MigrationRunnerTest(SimpleTestCase):
+
+    def messages(self, runner):
+        return dict([(dic['msg'], dic['affected'])
+                     for dic in runner.log.log_messages])
+
+    def test_dependencies(self):
+        runner = MigrationRunner([ProductMigration, CategoryMigration])
+        self.assertEqual(runner.dependencies[ProductMigration],
+                         set([CategoryMigration]))
+        self.assertEqual(runner.dependencies[CategoryMigration], set())
+
+    def test_dependents_of_failed_migration_are_skipped(self):
+        runner = MigrationRunner([ProductMigration, CategoryMigration],
+                                 processes=2)
+        runner.run()
+        messages = self.messages(runner)
+        self.assertEqual(
+            messages[u'Skipped as a migration it depends on failed.'],
+            [u'ProductMigration'])
+        self.assertIn(u'CategoryMigration', runner.timings)
+        self.assertNotIn(u'ProductMigration', runner.timings)
+
+    def test_indirect_dependents_of_failed_migration_are_skipped(self):
+        runner = MigrationRunner([CategoryMigration, ProductMigration,
+                                  ReviewMigration], processes=2)
+        runner.run()
+        messages = self.messages(runner)
+        self.assertEqual(
+            sorted(messages[u'Skipped as a migration it depends on failed.']),
+            [u'ProductMigration', u'ReviewMigration'])
+        self.assertNotIn(u'Started before its dependencies had finished, '
+                         'due to circular dependencies.', messages)
+        self.assertEqual(runner.timings.keys(), [u'CategoryMigration'])
+
+    def test_nullable_cycle_is_broken(self):
+        runner = MigrationRunner([BookMigration, AuthorMigration],
+                                 processes=2)
+        runner.run()
+        messages = self.messages(runner)
+        self.assertEqual(messages[u'Started before the migrations it has '
+                                  'nullable foreign keys to, due to circular '
+                                  'dependencies.'], [u'AuthorMigration'])
+        self.assertIn(u'AuthorMigration: Inserted.', messages)
+        self.assertIn(u'BookMigration: Inserted.', messages)